@@ -0,0 +1,145 @@
+import random
+from array import array
+
+from netlist import AND, NOT, OR, XOR, compile_circuit
+
+
+class Aig:
+    # And-Inverter Graph. Every node is a two input AND; inverters are a
+    # flag on the edges. A literal is 2 * node + complemented, node 0 is
+    # constant false (literal 0 false, 1 true) and input nodes have no
+    # fanins (-1). Structural hashing keeps one node per distinct pair of
+    # fanin literals, so repeated logic is built once.
+    FALSE, TRUE = 0, 1
+
+    def __init__(self, name):
+        self.name = name
+        self.fanin0 = array('l', [-1])
+        self.fanin1 = array('l', [-1])
+        self.inputs = {}        # input port name -> node
+        self.outputs = {}       # output port name -> literal
+        self.strash = {}        # (fanin literal, fanin literal) -> node
+        self.merged = 0         # AND requests answered by an existing node
+
+    def __len__(self):
+        # Number of AND nodes
+        return len(self.fanin0) - 1 - len(self.inputs)
+
+    def add_input(self, name):
+        self.fanin0.append(-1)
+        self.fanin1.append(-1)
+        node = self.inputs[name] = len(self.fanin0) - 1
+        return 2 * node
+
+    def AND(self, a, b):
+        if a > b:
+            a, b = b, a
+        if a == self.FALSE or a == b ^ 1:
+            return self.FALSE
+        if a == self.TRUE or a == b:
+            return b
+        node = self.strash.get((a, b))
+        if node is not None:
+            self.merged += 1
+            return 2 * node
+        self.fanin0.append(a)
+        self.fanin1.append(b)
+        node = self.strash[(a, b)] = len(self.fanin0) - 1
+        return 2 * node
+
+    def OR(self, a, b):
+        return self.AND(a ^ 1, b ^ 1) ^ 1
+
+    def XOR(self, a, b):
+        return self.OR(self.AND(a, b ^ 1), self.AND(a ^ 1, b))
+
+    def depth(self):
+        level = [0] * len(self.fanin0)
+        for node in range(1, len(self.fanin0)):
+            a, b = self.fanin0[node], self.fanin1[node]
+            if a >= 0:
+                level[node] = 1 + max(level[a >> 1], level[b >> 1])
+        return max((level[lit >> 1] for lit in self.outputs.values()),
+                   default=0)
+
+    def evaluate_words(self, inputs, width=64):
+        # Bit-parallel simulation, {input: word} -> {output: word} like
+        # Netlist.evaluate_words
+        mask = (1 << width) - 1
+        values = [0] * len(self.fanin0)
+        for name, word in inputs.items():
+            values[self.inputs[name]] = word & mask
+        fanin0, fanin1 = self.fanin0, self.fanin1
+        for node in range(1, len(values)):
+            a = fanin0[node]
+            if a < 0:
+                continue
+            b = fanin1[node]
+            x = values[a >> 1] ^ (mask if a & 1 else 0)
+            y = values[b >> 1] ^ (mask if b & 1 else 0)
+            values[node] = x & y
+        return {name: values[lit >> 1] ^ (mask if lit & 1 else 0)
+                for name, lit in self.outputs.items()}
+
+    def evaluate(self, inputs):
+        # {input: value} -> {output: bool}
+        words = {name: 1 if value else 0 for name, value in inputs.items()}
+        return {name: bool(word)
+                for name, word in self.evaluate_words(words, 1).items()}
+
+
+def netlist_to_aig(net):
+    # Rebuild a compiled Netlist as a structurally hashed Aig
+    aig = Aig(net.name)
+    lits = {}
+    for name, n in net.inputs.items():
+        lits[n] = aig.add_input(name)
+    for n, value in net.constants.items():
+        lits[n] = Aig.TRUE if value else Aig.FALSE
+    for op, a, b, out in zip(net.ops, net.in0, net.in1, net.outs):
+        x = lits.get(a, Aig.FALSE)      # undriven nets read as False
+        if op == NOT:
+            lits[out] = x ^ 1
+            continue
+        y = lits.get(b, Aig.FALSE)
+        if op == AND:
+            lits[out] = aig.AND(x, y)
+        elif op == OR:
+            lits[out] = aig.OR(x, y)
+        elif op == XOR:
+            lits[out] = aig.XOR(x, y)
+    for name, n in net.outputs.items():
+        aig.outputs[name] = lits.get(n, Aig.FALSE)
+    return aig
+
+
+def circuit_to_aig(root):
+    # Structurally hashed Aig of the LC hierarchy under root
+    return netlist_to_aig(compile_circuit(root))
+
+
+def equivalent(first, second, rounds=64, width=64, seed=0):
+    # Compare two Aigs (or anything with evaluate_words) over the same
+    # ports. Up to 16 inputs every vector is tried, which proves
+    # equivalence; wider circuits get rounds x width random vectors.
+    # Returns None when no difference was found, otherwise a
+    # counterexample {input: bool}.
+    names = sorted(first.inputs)
+    if len(names) <= 16:
+        width = 1 << len(names)
+        batches = [{name: sum(1 << k for k in range(width) if k >> j & 1)
+                    for j, name in enumerate(names)}]
+    else:
+        rng = random.Random(seed)
+        batches = [{name: rng.getrandbits(width) for name in names}
+                   for _ in range(rounds)]
+    for words in batches:
+        a = first.evaluate_words(words, width)
+        b = second.evaluate_words(words, width)
+        diff = 0
+        for name in a:
+            diff |= a[name] ^ b[name]
+        if diff:
+            k = (diff & -diff).bit_length() - 1
+            return {name: bool(word >> k & 1) for name, word in words.items()}
+    return None
@@ -0,0 +1,377 @@
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+
+# Benchmarks for the logic simulator. Run as
+#     python bench.py [name ...]
+# with no names every benchmark is run. A benchmark that guards a budget
+# returns False when it is exceeded and the script exits with status 1.
+
+IMPORT_BUDGET = 0.05          # seconds for a bare "import logic"
+IMPORT_FORBIDDEN = ('black', 'numpy')   # never pulled in by "import logic"
+
+
+def bench_import(runs=5):
+    # Time "import logic" in fresh interpreters and check that no heavy
+    # module sneaks into the startup path.
+    code = ("import sys, time\n"
+            "t = time.perf_counter()\n"
+            "import logic\n"
+            "print(time.perf_counter() - t)\n"
+            "print(' '.join(sorted(sys.modules)))\n")
+    best = None
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             capture_output=True, text=True).stdout
+        elapsed, modules = out.splitlines()
+        elapsed = float(elapsed)
+        if best is None or elapsed < best:
+            best = elapsed
+    loaded = [m for m in IMPORT_FORBIDDEN if m in modules.split()]
+    print("import logic: {0:.2f} ms (budget {1:.0f} ms)".format(
+        best * 1000, IMPORT_BUDGET * 1000))
+    if loaded:
+        print("  heavy modules imported: {0}".format(', '.join(loaded)))
+    return best <= IMPORT_BUDGET and not loaded
+
+
+def bench_bitparallel(count=64 * 1024, width=64):
+    # FullAdder vectors through the object graph, the compiled netlist one
+    # vector at a time, and the netlist width vectors per pass
+    from logic import FullAdder, apply_inputs
+    from netlist import compile_circuit
+
+    rng = random.Random(1)
+    words = [{name: rng.getrandbits(width) for name in ('A', 'B', 'Cin')}
+             for _ in range(count // width)]
+    vectors = [{name: bool(word >> k & 1) for name, word in group.items()}
+               for group in words for k in range(width)]
+    fa = FullAdder("F")
+    net = compile_circuit(fa)
+
+    start = time.perf_counter()
+    for vector in vectors:
+        apply_inputs({getattr(fa, name): value
+                      for name, value in vector.items()})
+    graph = time.perf_counter() - start
+    start = time.perf_counter()
+    for vector in vectors:
+        net.evaluate(vector)
+    flat = time.perf_counter() - start
+    start = time.perf_counter()
+    for group in words:
+        net.evaluate_words(group, width)
+    packed = time.perf_counter() - start
+    for label, elapsed in (('object graph', graph), ('netlist', flat),
+                           ('netlist x{0}'.format(width), packed)):
+        print("FullAdder {0:>14}: {1:12,.0f} vectors/s".format(
+            label, count / elapsed))
+
+
+def bench_arrays(count=1 << 20):
+    # FullAdder over count random vectors as NumPy bool and packed arrays
+    try:
+        import numpy as np
+    except ImportError:
+        print("numpy not installed, skipped")
+        return None
+    from logic import FullAdder
+    from netlist import compile_circuit
+
+    net = compile_circuit(FullAdder("F"))
+    rng = np.random.default_rng(1)
+    bools = {name: rng.random(count) < 0.5 for name in ('A', 'B', 'Cin')}
+    packed = {name: np.packbits(bits).view(np.uint64)
+              for name, bits in bools.items()}
+    for label, inputs in (('bool', bools), ('uint64', packed)):
+        start = time.perf_counter()
+        net.evaluate_arrays(inputs)
+        elapsed = time.perf_counter() - start
+        print("FullAdder {0:>7} arrays: {1:14,.0f} vectors/s".format(
+            label, count / elapsed))
+
+
+def bench_memory(count=1000):
+    # Bytes allocated per circuit instance while building count of them
+    from logic import And, Connector, FullAdder, HalfAdder, Xor
+
+    def build(make):
+        tracemalloc.start()
+        circuits = [make() for _ in range(count)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del circuits
+        return size / count
+
+    for label, make in (('Connector', lambda: Connector(None, 'A')),
+                        ('And', lambda: And("A1")),
+                        ('Xor', lambda: Xor("X1")),
+                        ('HalfAdder', lambda: HalfAdder("H1")),
+                        ('FullAdder', lambda: FullAdder("F"))):
+        print("{0:>10}: {1:8,.0f} bytes".format(label, build(make)))
+
+
+def bench_construction(count=2000):
+    # Building circuits as object graphs versus stamping template instances
+    from logic import FullAdder, HalfAdder, Xor
+    from netlist import instance
+
+    for cls in (Xor, HalfAdder, FullAdder):
+        start = time.perf_counter()
+        for _ in range(count):
+            cls("C")
+        graph = (time.perf_counter() - start) / count
+        start = time.perf_counter()
+        for _ in range(count):
+            instance(cls)
+        stamped = (time.perf_counter() - start) / count
+        print("{0:>10}: object graph {1:7.2f} us, instance {2:5.2f} us".format(
+            cls.__name__, graph * 1e6, stamped * 1e6))
+
+
+def alu_reference(op, a, b=0, cin=0):
+    # (S, Cout, N, Z, V) that ALU8.run should give, from Python ints. Cout
+    # is the borrow for SUB and DEC, and only set by NEG for 0.
+    from logic import ADD, DEC, INC, NEG, SUB
+
+    def signed(x):
+        return x - 256 if x & 128 else x
+
+    if op == ADD:
+        total, wide = a + b + cin, signed(a) + signed(b) + cin
+        cout = total > 255
+    elif op == SUB:
+        total, wide = a - b - cin, signed(a) - signed(b) - cin
+        cout = total < 0
+    elif op == NEG:
+        total, wide = -a, -signed(a)
+        cout = a == 0
+    elif op == INC:
+        total, wide = a + 1, signed(a) + 1
+        cout = total > 255
+    elif op == DEC:
+        total, wide = a - 1, signed(a) - 1
+        cout = total < 0
+    else:
+        total, wide = a, signed(a)
+        cout = False
+    s = total & 255
+    return s, int(cout), s >> 7, int(s == 0), int(not -128 <= wide <= 127)
+
+
+def bench_alu(count=5000):
+    # Operations per second through one reused ALU8 instance, every result
+    # checked against alu_reference
+    from logic import ALU8, PASS
+
+    rng = random.Random(1)
+    ops = [(rng.randrange(PASS + 1), rng.randrange(256), rng.randrange(256),
+            rng.randrange(2)) for _ in range(count)]
+    alu = ALU8("ALU")
+    start = time.perf_counter()
+    results = [alu.run(op, a, b, cin) for op, a, b, cin in ops]
+    elapsed = time.perf_counter() - start
+    for args, result in zip(ops, results):
+        if result != alu_reference(*args):
+            print("ALU8 is wrong: run{0} gave {1}, expected {2}".format(
+                args, result, alu_reference(*args)))
+            return False
+    print("ALU8 object graph: {0:10,.0f} ops/s".format(count / elapsed))
+
+
+ADDER_WIDTHS = (8, 16, 32, 64)
+
+
+def adder_families():
+    # (label, constructor taking a width) for every adder design
+    from logic import (CarryLookaheadAdder, CarrySelectAdder, CarrySkipAdder,
+                       PrefixAdder, RippleCarryAdder)
+
+    families = [('ripple', lambda n: RippleCarryAdder("R", n)),
+                ('lookahead', lambda n: CarryLookaheadAdder("L", n))]
+    for kind in PrefixAdder.kinds:
+        families.append((kind, lambda n, kind=kind: PrefixAdder("P", n, kind)))
+    families.append(('select/4', lambda n: CarrySelectAdder("C", n, 4)))
+    families.append(('skip/4', lambda n: CarrySkipAdder("K", n, 4)))
+    return families
+
+
+def bench_adders(count=300):
+    # Primitive gate count and depth, construction time, gate evaluations
+    # and delta cycles (settle depth) per add and adds per second for every
+    # adder family and width. Every sum is checked against Python ints.
+    from logic import scheduler
+    from netlist import compile_circuit
+
+    ok = True
+    rng = random.Random(1)
+    print("{0:>12} {1:>5} {2:>6} {3:>6} {4:>9} {5:>10} {6:>10} "
+          "{7:>8}".format('adder', 'bits', 'gates', 'depth', 'build ms',
+                          'evals/add', 'deltas/add', 'adds/s'))
+    for label, make in adder_families():
+        for n in ADDER_WIDTHS:
+            start = time.perf_counter()
+            adder = make(n)
+            build = time.perf_counter() - start
+            net = compile_circuit(adder)
+            operands = [(rng.getrandbits(n), rng.getrandbits(n),
+                         rng.getrandbits(1)) for _ in range(count)]
+            evaluations = scheduler.evaluations
+            deltas = scheduler.delta
+            start = time.perf_counter()
+            results = [adder.add(a, b, cin) for a, b, cin in operands]
+            elapsed = time.perf_counter() - start
+            evaluations = scheduler.evaluations - evaluations
+            deltas = scheduler.delta - deltas
+            for (a, b, cin), (total, cout) in zip(operands, results):
+                if total + (cout << n) != a + b + cin:
+                    print("{0} {1} bit adder is wrong: {2} + {3} + {4} "
+                          "gave {5}".format(label, n, a, b, cin,
+                                            total + (cout << n)))
+                    ok = False
+                    break
+            print("{0:>12} {1:>5} {2:>6} {3:>6} {4:>9.2f} {5:>10.0f} "
+                  "{6:>10.1f} {7:>8,.0f}".format(
+                      label, n, len(net), net.depth(), build * 1000,
+                      evaluations / count, deltas / count, count / elapsed))
+    return ok
+
+
+def bench_clock(cycles=2000, n=16):
+    # Clock cycles per second of an n bit accumulator, Register feeding a
+    # RippleCarryAdder that adds a constant input back into it
+    from logic import (Clock, Register, RippleCarryAdder, apply_inputs,
+                       bus_inputs)
+
+    acc = Register("ACC", n)
+    adder = RippleCarryAdder("R", n)
+    for i in range(n):
+        acc.Q[i].connect(adder.A[i])
+        adder.S[i].connect(acc.D[i])
+    values = bus_inputs(adder.B, 3)
+    values[adder.Cin] = 0
+    apply_inputs(values)
+    clock = Clock(acc)
+    start = time.perf_counter()
+    clock.run(cycles)
+    elapsed = time.perf_counter() - start
+    if acc.value() != cycles * 3 % (1 << n):
+        print("accumulator is wrong: {0}".format(acc.value()))
+        return False
+    print("{0} bit accumulator: {1:10,.0f} cycles/s".format(
+        n, cycles / elapsed))
+
+
+def bench_memo(count=1000, n=32):
+    # n bit ripple adder with plain and memoized FullAdders
+    from logic import FullAdder, RippleCarryAdder, scheduler
+    from netlist import memoize_all
+
+    rng = random.Random(1)
+    operands = [(rng.getrandbits(n), rng.getrandbits(n), rng.getrandbits(1))
+                for _ in range(count)]
+    for label in ('plain', 'memoized'):
+        adder = RippleCarryAdder("R", n)
+        if label == 'memoized':
+            memoize_all(adder, [FullAdder])
+        evaluations = scheduler.evaluations
+        start = time.perf_counter()
+        for a, b, cin in operands:
+            adder.add(a, b, cin)
+        elapsed = time.perf_counter() - start
+        print("{0} bit ripple, {1:>8} FullAdders: {2:6.0f} evals/add, "
+              "{3:8,.0f} adds/s".format(
+                  n, label, (scheduler.evaluations - evaluations) / count,
+                  count / elapsed))
+
+
+def bench_lut(count=2000):
+    # Gates against k input LUTs: size, depth and interpreted evaluation
+    # speed of the compiled netlist and of its LUT mapping
+    from logic import ALU8, RippleCarryAdder
+    from lut import map_luts
+    from netlist import compile_circuit
+
+    rng = random.Random(1)
+    for root in (RippleCarryAdder("R16", 16), ALU8("ALU")):
+        net = compile_circuit(root)
+        vectors = [{name: rng.random() < 0.5 for name in net.inputs}
+                   for _ in range(count)]
+        start = time.perf_counter()
+        for vector in vectors:
+            net.evaluate(vector)
+        print("{0:>5} gates: {1:5} steps, depth {2:3}, {3:8,.0f} evals/s"
+              .format(root.name, len(net), net.depth(),
+                      count / (time.perf_counter() - start)))
+        for k in (4, 6):
+            mapped = map_luts(net, k)
+            start = time.perf_counter()
+            for vector in vectors:
+                mapped.evaluate(vector)
+            print("{0:>5}  LUT{1}: {2:5} steps, depth {3:3}, {4:8,.0f} "
+                  "evals/s".format(root.name, k, len(mapped), mapped.depth(),
+                                   count / (time.perf_counter() - start)))
+
+
+def bench_xor(count=2000):
+    # Gate evaluations per FullAdder vector with Xor built from five gates
+    # and as the primitive XorGate, and compiled gate counts before and
+    # after recognize_xor
+    from logic import (FullAdder, RippleCarryAdder, Xor, XorGate,
+                       apply_inputs, scheduler)
+    from netlist import compile_circuit
+    from optimize import recognize_xor
+
+    rng = random.Random(1)
+    vectors = [{name: rng.random() < 0.5 for name in ('A', 'B', 'Cin')}
+               for _ in range(count)]
+    for xor in (Xor, XorGate):
+        fa = FullAdder("F", xor)
+        evaluations = scheduler.evaluations
+        start = time.perf_counter()
+        for vector in vectors:
+            apply_inputs({getattr(fa, name): value
+                          for name, value in vector.items()})
+        elapsed = time.perf_counter() - start
+        print("FullAdder, {0:>7}: {1:5.1f} evals/vector, {2:8,.0f} "
+              "vectors/s".format(xor.__name__,
+                                 (scheduler.evaluations - evaluations)
+                                 / count, count / elapsed))
+    for root in (FullAdder("F"), RippleCarryAdder("R16", 16)):
+        net = compile_circuit(root)
+        new, found = recognize_xor(net)
+        print("{0:>5}: {1:4} gates, depth {2:3} -> {3:4} gates, depth {4:3} "
+              "({5} Xors)".format(root.name, len(net), net.depth(), len(new),
+                                  new.depth(), found))
+
+
+BENCHMARKS = {
+    'import': bench_import,
+    'bitparallel': bench_bitparallel,
+    'arrays': bench_arrays,
+    'memory': bench_memory,
+    'construction': bench_construction,
+    'alu': bench_alu,
+    'adders': bench_adders,
+    'clock': bench_clock,
+    'memo': bench_memo,
+    'lut': bench_lut,
+    'xor': bench_xor,
+}
+
+
+def main(names):
+    ok = True
+    for name in names or BENCHMARKS:
+        start = time.perf_counter()
+        if BENCHMARKS[name]() is False:
+            ok = False
+        print("[{0}] {1:.2f} s".format(name, time.perf_counter() - start))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,51 +1,334 @@
+class CircuitLoopError(ValueError):
+    # A combinational loop. path names the connectors around it when known.
+    def __init__(self, message, path=()):
+        ValueError.__init__(self, message)
+        self.path = list(path)
+
+
+class Scheduler:
+    # Event driven settle loop. A changed input connector queues its owner
+    # instead of evaluating it inline; queued gates are evaluated one delta
+    # cycle at a time and each gate runs at most once per delta cycle.
+    # Gates whose outputs change during a delta queue their fanout for the
+    # next one, so settling never recurses through the circuit.
+    def __init__(self):
+        self.pending = []       # gates to evaluate in the next delta cycle
+        self.queued = set()     # ids of the gates in pending
+        self.running = False
+        self.held = 0           # open batches, settling waits for all to close
+        self.delta = 0          # delta cycles run so far
+        self.time = 0           # trace time, delta cycles plus input steps
+        self.limit = 100000     # delta cycles one settle may take
+        self.evaluations = 0    # gate evaluations run so far
+        self.profile = None     # Profile counting per gate, off when None
+        self.monitors = []      # told of every change to monitor connectors
+
+    def schedule(self, gate):
+        if id(gate) not in self.queued:
+            self.queued.add(id(gate))
+            self.pending.append(gate)
+
+    def now(self):
+        # Trace time of a change made right now. Changes made between
+        # settles are inputs to the next one, a step after the last delta
+        # cycle and before the first delta cycle of that settle.
+        return self.time if self.running else self.time + 1
+
+    def run(self):
+        if self.running or self.held:
+            return      # Already settling or batching, work joins the queue
+        self.running = True
+        start = self.delta
+        if self.pending:
+            self.time += 1      # the input step, see now()
+        try:
+            while self.pending:
+                gates = self.pending
+                self.pending = []
+                self.queued = set()
+                self.delta += 1
+                self.time += 1
+                if self.delta - start > self.limit:
+                    raise CircuitLoopError(
+                        "circuit did not settle in {0} delta cycles, check "
+                        "it with find_loop()".format(self.limit))
+                self.evaluations += len(gates)
+                if self.profile is not None:
+                    self.profile.evaluated(gates)
+                for gate in gates:
+                    gate.evaluate()
+        except CircuitLoopError:
+            self.pending = []
+            self.queued = set()
+            raise
+        finally:
+            self.running = False
+
+
+scheduler = Scheduler()
+
+
+class batch:
+    # Holds settling while a group of inputs is set so the circuit is only
+    # evaluated once the whole input vector is in place
+    #     with batch():
+    #         F0.A.set(1)
+    #         F0.B.set(0)
+    def __enter__(self):
+        scheduler.held += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        scheduler.held -= 1
+        if exc_type is None:
+            scheduler.run()
+
+
+def apply_inputs(values):
+    # Set a whole input vector, {connector: value}, and settle once
+    with batch():
+        for con, value in values.items():
+            con.set(value)
+
 
-from black import main
+class Profile:
+    # Evaluation and Connector.set counts per gate instance. Costs nothing
+    # but a None check while not installed on the scheduler:
+    #     with profiling() as profile:
+    #         alu.run(ADD, 3, 4)
+    #     print(profile.report(alu))
+    def __init__(self):
+        self.gates = {}         # id -> gate, keeps the ids below alive
+        self.evaluations = {}   # id(gate) -> evaluations
+        self.sets = {}          # id(gate) -> set calls on its connectors
+        self.redundant = {}     # id(gate) -> set calls that changed nothing
+
+    def evaluated(self, gates):
+        counts = self.evaluations
+        for gate in gates:
+            key = id(gate)
+            self.gates[key] = gate
+            counts[key] = counts.get(key, 0) + 1
+
+    def set_called(self, con, changed):
+        key = id(con.owner)
+        self.gates[key] = con.owner
+        self.sets[key] = self.sets.get(key, 0) + 1
+        if not changed:
+            self.redundant[key] = self.redundant.get(key, 0) + 1
+
+    def by_class(self):
+        # {class name: [evaluations, sets, redundant sets]}
+        totals = {}
+        for key, gate in self.gates.items():
+            row = totals.setdefault(type(gate).__name__, [0, 0, 0])
+            row[0] += self.evaluations.get(key, 0)
+            row[1] += self.sets.get(key, 0)
+            row[2] += self.redundant.get(key, 0)
+        return totals
+
+    def report(self, root=None, top=10):
+        # Per class totals and the top hottest gates. Gates under root are
+        # shown by hierarchical name, others by their own name.
+        names = {}
+        if root is not None:
+            for path, lc in root.walk():
+                names[id(lc)] = path
+        lines = ["{0:<16} {1:>10} {2:>10} {3:>10}".format(
+            'class', 'evals', 'sets', 'no-change')]
+        for cls, row in sorted(self.by_class().items(),
+                               key=lambda item: -item[1][0]):
+            lines.append("{0:<16} {1:>10} {2:>10} {3:>10}".format(cls, *row))
+        lines.append('')
+        lines.append("{0:<40} {1:>10} {2:>10} {3:>10}".format(
+            'hottest gates', 'evals', 'sets', 'no-change'))
+        hot = sorted(self.gates, key=lambda key: (
+            -self.evaluations.get(key, 0), -self.redundant.get(key, 0)))
+        for key in hot[:top]:
+            gate = self.gates[key]
+            lines.append("{0:<40} {1:>10} {2:>10} {3:>10}".format(
+                names.get(key, gate.name), self.evaluations.get(key, 0),
+                self.sets.get(key, 0), self.redundant.get(key, 0)))
+        return '\n'.join(lines)
+
+
+class profiling:
+    # Installs a fresh Profile on the scheduler for the with block
+    def __enter__(self):
+        self.profile = scheduler.profile = Profile()
+        return self.profile
+
+    def __exit__(self, exc_type, exc, tb):
+        scheduler.profile = None
 
 
 class Connector:
     # Connectors are inputs and outputs. Only outputs should connect
     # to inputs. Be careful NOT to have circular references
     # As an output is changed it propagates the change to its connected inputs
+    # and queues the gates they activate on the scheduler
     #
+    __slots__ = ('value', 'owner', 'name', 'monitor', 'connects', 'activates')
+
     def __init__(self, owner, name, activates=0, monitor=0):
         self.value = None
         self.owner = owner
         self.name = name
         self.monitor = monitor
-        self.connects = []
-        self.activates = activates   # If true change kicks evaluate function
+        self.connects = ()           # Tuple, most connectors never fan out
+        # If true change kicks evaluate function. Composites without one of
+        # their own only pass changes on through their wires, so they are
+        # never queued.
+        if owner is not None and not evaluates(owner):
+            activates = 0
+        self.activates = activates
 
     def connect(self, inputs):
         if not isinstance(inputs, list):
             inputs = [inputs]
-        for input in inputs:
-            self.connects.append(input)
+        self.connects = self.connects + tuple(inputs)
+        if self.value is not None:      # Late wires see the current value
+            for input in inputs:
+                input.set(self.value)
 
     def set(self, value):
+        if scheduler.profile is not None:
+            scheduler.profile.set_called(self, self.value != value)
         if self.value == value:
             return      # Ignore if no change
-        self.value = value
-        if self.activates:
-            self.owner.evaluate()
-        # if self.monitor:
-        #     print("Connector {0}-{1} set to {2}".format(self.owner.name,
-        #                                                 self.name,
-        #                                                 self.value))
-        for con in self.connects:
-            con.set(value)
+        # Walk the wires with an explicit stack and queue the gates they
+        # activate, then let the scheduler settle the circuit
+        stack = [self]
+        while stack:
+            con = stack.pop()
+            if con.value == value:
+                continue
+            con.value = value
+            if con.activates:
+                scheduler.schedule(con.owner)
+            if con.monitor and scheduler.monitors:
+                for monitor in scheduler.monitors:
+                    monitor.record(con, value)
+            stack.extend(con.connects)
+        scheduler.run()
 
 
 class LC:
     # Logic Circuits have names and an evaluation function defined in child
     # classes. They will also contain a set of inputs and outputs.
+    # Primitive gates list their connectors in __slots__ to stay small;
+    # composites leave __slots__ out and keep their parts in a __dict__.
+    __slots__ = ('name',)
+    inputs = ()     # Names of the input ports, a port is a Connector or a
+    outputs = ()    # list of them (a bus, least significant bit first)
+
     def __init__(self, name):
         self.name = name
 
     def evaluate(self):
         return
 
+    def ports(self, names=None):
+        # Connectors of the named ports with buses expanded, all by default
+        if names is None:
+            names = self.inputs + self.outputs
+        for name in names:
+            port = getattr(self, name)
+            if isinstance(port, list):
+                for con in port:
+                    yield con
+            else:
+                yield port
+
+    def finalize(self):
+        # Check a finished circuit before use, see check_loops
+        check_loops(self)
+        return self
+
+    def walk(self, path=None):
+        # (hierarchical name, circuit) for this circuit and all below it
+        if path is None:
+            path = self.name
+        yield path, self
+        for part in self.parts():
+            for item in part.walk(path + '.' + part.name):
+                yield item
+
+    def parts(self):
+        # Child circuits, held directly or in lists
+        for value in getattr(self, '__dict__', {}).values():
+            if isinstance(value, LC):
+                yield value
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, LC):
+                        yield item
+
+
+def evaluates(lc):
+    # True when lc has an evaluate of its own: a primitive gate, or a
+    # composite given one per instance such as a memoized one
+    return (type(lc).evaluate is not LC.evaluate or
+            'evaluate' in getattr(lc, '__dict__', ()))
+
+
+def find_loop(root):
+    # Depth first search of the connector graph under root, linear in its
+    # size. Wires lead from a connector to the ones it connects to, and an
+    # input that activates a gate with its own evaluate (a primitive or a
+    # memoized composite) leads to the gate's outputs. Returns the
+    # hierarchical connector names around the first loop found, or None.
+    names = {}
+    for path, lc in root.walk():
+        for con in lc.ports():
+            names[id(con)] = path + '.' + con.name
+
+    def fanout(con):
+        out = [c for c in con.connects if id(c) in names]
+        owner = con.owner
+        if con.activates and evaluates(owner):
+            out.extend(c for c in owner.ports(owner.outputs)
+                       if id(c) in names)
+        return iter(out)
+
+    state = {}      # id(connector) -> position on the stack, DONE after
+    DONE = -1
+    for path, lc in root.walk():
+        for first in lc.ports():
+            if id(first) in state:
+                continue
+            state[id(first)] = 0
+            stack = [(first, fanout(first))]
+            while stack:
+                con, edges = stack[-1]
+                nxt = next(edges, None)
+                if nxt is None:
+                    state[id(con)] = DONE
+                    stack.pop()
+                    continue
+                at = state.get(id(nxt))
+                if at is None:
+                    state[id(nxt)] = len(stack)
+                    stack.append((nxt, fanout(nxt)))
+                elif at != DONE:
+                    return ([names[id(c)] for c, edges in stack[at:]] +
+                            [names[id(nxt)]])
+    return None
+
+
+def check_loops(root):
+    # Raise CircuitLoopError naming the loop if the circuit has one
+    loop = find_loop(root)
+    if loop:
+        raise CircuitLoopError("combinational loop: " + ' -> '.join(loop),
+                               loop)
+
 
 class Not(LC):         # Inverter. Input A. Output B.
+    __slots__ = ('A', 'B')
+    inputs = ('A',)
+    outputs = ('B',)
+
     def __init__(self, name):
         LC.__init__(self, name)
         self.A = Connector(self, 'A', activates=1)
@@ -56,6 +339,10 @@ class Not(LC):         # Inverter. Input A. Output B.
 
 
 class Gate2(LC):         # two input gates. Inputs A and B. Output C.
+    __slots__ = ('A', 'B', 'C')
+    inputs = ('A', 'B')
+    outputs = ('C',)
+
     def __init__(self, name):
         LC.__init__(self, name)
         self.A = Connector(self, 'A', activates=1)
@@ -64,6 +351,8 @@ class Gate2(LC):         # two input gates. Inputs A and B. Output C.
 
 
 class And(Gate2):       # two input AND Gate
+    __slots__ = ()
+
     def __init__(self, name):
         Gate2.__init__(self, name)
 
@@ -72,6 +361,8 @@ class And(Gate2):       # two input AND Gate
 
 
 class Or(Gate2):         # two input OR gate.
+    __slots__ = ()
+
     def __init__(self, name):
         Gate2.__init__(self, name)
 
@@ -79,6 +370,28 @@ class Or(Gate2):         # two input OR gate.
         self.C.set(self.A.value or self.B.value)
 
 
+class Const(LC):         # Tied off signal. Output C, always value
+    __slots__ = ('C', 'value')
+    outputs = ('C',)
+
+    def __init__(self, name, value):
+        LC.__init__(self, name)
+        self.C = Connector(self, 'C')
+        self.value = value
+        self.C.set(value)
+
+
+class XorGate(Gate2):         # two input XOR as a single primitive gate
+    # Pass it as the xor of HalfAdder, FullAdder or RippleCarryAdder to
+    # build them with it instead of the five gate Xor
+    __slots__ = ()
+
+    def evaluate(self):
+        # Same values as the five gate Xor below, unset inputs included
+        a, b = self.A.value, self.B.value
+        self.C.set((a and not b) or (b and not a))
+
+
 class Xor(Gate2):
     def __init__(self, name):
         Gate2.__init__(self, name)
@@ -96,14 +409,40 @@ class Xor(Gate2):
         self.O1.C.connect([self.C])
 
 
-class HalfAdder(LC):         # One bit adder, A,B in. Sum and Carry out
+class Mux(LC):         # Two way selector. A, B, S in. C = B if S else A
+    inputs = ('A', 'B', 'S')
+    outputs = ('C',)
+
     def __init__(self, name):
+        LC.__init__(self, name)
+        self.A = Connector(self, 'A', 1)
+        self.B = Connector(self, 'B', 1)
+        self.S = Connector(self, 'S', 1)
+        self.C = Connector(self, 'C')
+        self.I1 = Not("I1")
+        self.A1 = And("A1")
+        self.A2 = And("A2")
+        self.O1 = Or("O1")
+        self.S.connect([self.I1.A, self.A2.B])
+        self.A.connect([self.A1.A])
+        self.B.connect([self.A2.A])
+        self.I1.B.connect([self.A1.B])
+        self.A1.C.connect([self.O1.A])
+        self.A2.C.connect([self.O1.B])
+        self.O1.C.connect([self.C])
+
+
+class HalfAdder(LC):         # One bit adder, A,B in. Sum and Carry out
+    inputs = ('A', 'B')
+    outputs = ('S', 'C')
+
+    def __init__(self, name, xor=Xor):   # xor=XorGate for a primitive Xor
         LC.__init__(self, name)
         self.A = Connector(self, 'A', 1)
         self.B = Connector(self, 'B', 1)
         self.S = Connector(self, 'S')
         self.C = Connector(self, 'C')
-        self.X1 = Xor("X1")
+        self.X1 = xor("X1")
         self.A1 = And("A1")
         self.A.connect([self.X1.A, self.A1.A])
         self.B.connect([self.X1.B, self.A1.B])
@@ -112,15 +451,18 @@ class HalfAdder(LC):         # One bit adder, A,B in. Sum and Carry out
 
 
 class FullAdder(LC):         # One bit adder, A,B,Cin in. Sum and Cout out
-    def __init__(self, name):
+    inputs = ('A', 'B', 'Cin')
+    outputs = ('S', 'Cout')
+
+    def __init__(self, name, xor=Xor):   # xor is passed to the HalfAdders
         LC.__init__(self, name)
         self.A = Connector(self, 'A', 1, monitor=1)
         self.B = Connector(self, 'B', 1, monitor=1)
         self.Cin = Connector(self, 'Cin', 1, monitor=1)
         self.S = Connector(self, 'S', monitor=1)
         self.Cout = Connector(self, 'Cout', monitor=1)
-        self.H1 = HalfAdder("H1")
-        self.H2 = HalfAdder("H2")
+        self.H1 = HalfAdder("H1", xor)
+        self.H2 = HalfAdder("H2", xor)
         self.O1 = Or("O1")
         self.A.connect([self.H1.A])
         self.B.connect([self.H1.B])
@@ -132,38 +474,478 @@ class FullAdder(LC):         # One bit adder, A,B,Cin in. Sum and Cout out
         self.O1.C.connect([self.Cout])
 
 
+def bus(owner, name, width, activates=0):
+    # A multi-bit port: connectors name0 .. name<width-1>, LSB first
+    return [Connector(owner, name + str(i), activates) for i in range(width)]
+
+
+def bus_inputs(bus, value):
+    # {connector: bit} putting the int value on a bus, for apply_inputs
+    return {con: bool(value >> i & 1) for i, con in enumerate(bus)}
+
+
+def bus_value(bus):
+    # The int currently on a bus
+    return sum(1 << i for i, con in enumerate(bus) if con.value)
+
+
+def wire(parts, cls, name, *inputs):
+    # New gate cls(name) fed by the given connectors and kept in parts.
+    # Returns the gate's (first) output connector.
+    gate = cls(name)
+    for con, port in zip(inputs, gate.ports(gate.inputs)):
+        con.connect(port)
+    parts.append(gate)
+    return next(gate.ports(gate.outputs))
+
+
+def wire_tree(parts, cls, name, inputs):
+    # Balanced tree of two input cls gates over the connectors in inputs,
+    # kept in parts. Returns the root output (the input itself if alone).
+    level = list(inputs)
+    count = 0
+    while len(level) > 1:
+        pairs = []
+        for i in range(0, len(level) - 1, 2):
+            pairs.append(wire(parts, cls, name + str(count),
+                              level[i], level[i + 1]))
+            count += 1
+        if len(level) % 2:
+            pairs.append(level[-1])
+        level = pairs
+    return level[0]
+
+
+class Adder(LC):         # n bit adders. A,B,Cin in. Sum and Cout out
+    inputs = ('A', 'B', 'Cin')
+    outputs = ('S', 'Cout')
+
+    # Child classes build the logic between the ports, loose gates go in
+    # self.gates
+    def __init__(self, name, n):
+        LC.__init__(self, name)
+        self.A = bus(self, 'A', n, 1)
+        self.B = bus(self, 'B', n, 1)
+        self.Cin = Connector(self, 'Cin', 1)
+        self.S = bus(self, 'S', n)
+        self.Cout = Connector(self, 'Cout')
+        self.gates = []
+        self.count = 0
+
+    def unique(self, prefix):
+        # A fresh gate name
+        self.count += 1
+        return prefix + str(self.count)
+
+    def add(self, a, b, cin=0):
+        # Settle a + b + cin and return (sum, carry out) as ints. Build the
+        # adder once and call this as often as needed.
+        values = bus_inputs(self.A, a)
+        values.update(bus_inputs(self.B, b))
+        values[self.Cin] = bool(cin)
+        apply_inputs(values)
+        return bus_value(self.S), int(bool(self.Cout.value))
+
+
+class RippleCarryAdder(Adder):   # n FullAdders, each carry feeds the next
+    def __init__(self, name, n, xor=Xor):    # xor is passed to the adders
+        Adder.__init__(self, name, n)
+        self.adders = [FullAdder("F" + str(i), xor) for i in range(n)]
+        carry = self.Cin
+        for i, F in enumerate(self.adders):
+            self.A[i].connect(F.A)
+            self.B[i].connect(F.B)
+            carry.connect(F.Cin)
+            F.S.connect(self.S[i])
+            carry = F.Cout
+        carry.connect(self.Cout)
+
+
+class CarryLookaheadAdder(Adder):   # 4 bit lookahead blocks, hierarchical
+    # Bit i generates g = A.B and propagates p = A^B. Blocks of 4 bits
+    # compute their group generate/propagate, groups of 4 blocks do the
+    # same one level up, and so on; carries then flow back down the tree,
+    # every carry being a two level And/Or of the g, p and carry in of
+    # its block. Settle depth grows with log4(n) instead of n.
+    def __init__(self, name, n):
+        Adder.__init__(self, name, n)
+        g = [wire(self.gates, And, "G" + str(i), self.A[i], self.B[i])
+             for i in range(n)]
+        p = [wire(self.gates, Xor, "P" + str(i), self.A[i], self.B[i])
+             for i in range(n)]
+        block = self.group(g, p)
+        carries = [self.Cin] + self.carries(block, self.Cin)
+        for i in range(n):
+            wire(self.gates, Xor, "S" + str(i), p[i], carries[i]).connect(
+                self.S[i])
+        G, P = block[0], block[1]
+        wire(self.gates, Or, "CO", G,
+             wire(self.gates, And, "CP", P, self.Cin)).connect(self.Cout)
+
+    def lookahead(self, g, p, cin, last):
+        # Two level And/Or for g[last] | p[last].g[last-1] | ... ending in
+        # p[last]...p[0].cin, or without the cin term when cin is None
+        terms = []
+        for j in range(last, -1, -1):
+            terms.append(wire_tree(self.gates, And, self.unique("T"),
+                                   p[j + 1:last + 1] + [g[j]]))
+        if cin is not None:
+            terms.append(wire_tree(self.gates, And, self.unique("T"),
+                                   p[:last + 1] + [cin]))
+        return wire_tree(self.gates, Or, self.unique("O"), terms)
+
+    def group(self, g, p):
+        # (G, P, blocks) group generate/propagate of bits g, p. Up to 4
+        # bits form a leaf block, wider spans are split into 4 sub blocks.
+        if len(g) <= 4:
+            blocks = None
+        else:
+            size = 4
+            while size * 4 < len(g):
+                size *= 4
+            blocks = [self.group(g[i:i + size], p[i:i + size])
+                      for i in range(0, len(g), size)]
+            g = [block[0] for block in blocks]
+            p = [block[1] for block in blocks]
+        G = self.lookahead(g, p, None, len(g) - 1)
+        P = wire_tree(self.gates, And, self.unique("GP"), p)
+        return G, P, blocks, g, p
+
+    def carries(self, block, cin):
+        # Carries into every bit of block after its first, given its cin
+        G, P, blocks, g, p = block
+        inner = [self.lookahead(g, p, cin, j) for j in range(len(g) - 1)]
+        if blocks is None:
+            return inner
+        carries = []
+        for k, sub in enumerate(blocks):
+            c = inner[k - 1] if k else cin
+            if k:
+                carries.append(c)
+            carries.extend(self.carries(sub, c))
+        return carries
+
+
+class PrefixAdder(Adder):   # log depth parallel prefix adder
+    # Carries are prefixes of (g, p) pairs under the operator
+    #     (G, P) o (G', P') = (G | P.G', P.P')
+    # with the carry in folded into bit 0. The kind picks the prefix
+    # network:
+    #   kogge-stone  log2(n) levels, most gates, fanout 2
+    #   brent-kung   2.log2(n) levels, fewest gates
+    #   sklansky     log2(n) levels, fewer gates but fanout up to n/2
+    kinds = ('kogge-stone', 'brent-kung', 'sklansky')
+
+    def __init__(self, name, n, kind='kogge-stone'):
+        if kind not in self.kinds:
+            raise ValueError("unknown prefix adder kind {0!r}, pick one of "
+                             "{1}".format(kind, ', '.join(self.kinds)))
+        Adder.__init__(self, name, n)
+        self.kind = kind
+        gates = self.gates
+        g = [wire(gates, And, "G" + str(i), self.A[i], self.B[i])
+             for i in range(n)]
+        p = [wire(gates, Xor, "P" + str(i), self.A[i], self.B[i])
+             for i in range(n)]
+        # node[i] is (G, P) over bits j..i; P is None once j reaches 0
+        # since spans starting at bit 0 never need their propagate
+        node = [(g[i], p[i]) for i in range(n)]
+        node[0] = (self.combine(node[0], (self.Cin, None))[0], None)
+        for i, j in self.network(n):
+            node[i] = self.combine(node[i], node[j])
+        carries = [self.Cin] + [G for G, P in node]
+        for i in range(n):
+            wire(gates, Xor, "S" + str(i), p[i], carries[i]).connect(
+                self.S[i])
+        carries[n].connect(self.Cout)
+
+    def combine(self, hi, lo):
+        # Prefix nodes are GC/PC so they never clash with the per bit G, P
+        G = wire(self.gates, Or, self.unique("GC"), hi[0],
+                 wire(self.gates, And, self.unique("T"), hi[1], lo[0]))
+        if lo[1] is None:
+            return G, None
+        return G, wire(self.gates, And, self.unique("PC"), hi[1], lo[1])
+
+    def network(self, n):
+        # (i, j) steps node[i] = node[i] o node[j] in evaluation order
+        steps = []
+        if self.kind == 'kogge-stone':
+            d = 1
+            while d < n:
+                # Every step of a level reads the previous level, so go
+                # from the top down to avoid reading a fresh value
+                steps.extend((i, i - d) for i in range(n - 1, d - 1, -1))
+                d *= 2
+        elif self.kind == 'sklansky':
+            d = 1
+            while d < n:
+                steps.extend((i, (i // d) * d - 1) for i in range(n)
+                             if (i // d) % 2)
+                d *= 2
+        else:
+            d = 1
+            while 2 * d <= n:
+                steps.extend((i, i - d) for i in range(2 * d - 1, n, 2 * d))
+                d *= 2
+            while d > 1:
+                d //= 2
+                steps.extend((i, i - d) for i in range(3 * d - 1, n, 2 * d))
+        return steps
+
+
+class CarrySelectAdder(Adder):   # ripple blocks computed for both carries
+    # The first block ripples from Cin. Every other block is built twice,
+    # once with a carry in of 0 and once with 1, and the real carry out
+    # of the block below picks sums and carry out through Muxes, so the
+    # carry crosses one Mux per block instead of rippling through it.
+    def __init__(self, name, n, block=4):
+        Adder.__init__(self, name, n)
+        self.zero = Const("ZERO", 0)
+        self.one = Const("ONE", 1)
+        self.blocks = []
+        self.muxes = []
+        carry = self.Cin
+        for lo in range(0, n, block):
+            width = min(block, n - lo)
+            if lo == 0:
+                R = RippleCarryAdder("R0", width)
+                self.blocks.append(R)
+                self.feed(R, lo, width)
+                carry.connect(R.Cin)
+                for i in range(width):
+                    R.S[i].connect(self.S[lo + i])
+                carry = R.Cout
+                continue
+            R0 = RippleCarryAdder("R" + str(lo) + "_0", width)
+            R1 = RippleCarryAdder("R" + str(lo) + "_1", width)
+            self.blocks.extend([R0, R1])
+            self.feed(R0, lo, width)
+            self.feed(R1, lo, width)
+            self.zero.C.connect(R0.Cin)
+            self.one.C.connect(R1.Cin)
+            for i in range(width):
+                self.select(R0.S[i], R1.S[i], carry).connect(self.S[lo + i])
+            carry = self.select(R0.Cout, R1.Cout, carry)
+        carry.connect(self.Cout)
+
+    def feed(self, R, lo, width):
+        for i in range(width):
+            self.A[lo + i].connect(R.A[i])
+            self.B[lo + i].connect(R.B[i])
+
+    def select(self, a, b, s):
+        M = Mux(self.unique("M"))
+        self.muxes.append(M)
+        a.connect(M.A)
+        b.connect(M.B)
+        s.connect(M.S)
+        return M.C
+
+
+class CarrySkipAdder(Adder):   # ripple blocks with a carry bypass
+    # Each block ripples as usual, but when every bit of the block
+    # propagates (A^B all ones) a Mux passes the block's carry in straight
+    # to its carry out, skipping the ripple through the block.
+    def __init__(self, name, n, block=4):
+        Adder.__init__(self, name, n)
+        self.blocks = []
+        self.muxes = []
+        carry = self.Cin
+        for lo in range(0, n, block):
+            width = min(block, n - lo)
+            R = RippleCarryAdder("R" + str(lo), width)
+            self.blocks.append(R)
+            p = []
+            for i in range(width):
+                self.A[lo + i].connect(R.A[i])
+                self.B[lo + i].connect(R.B[i])
+                R.S[i].connect(self.S[lo + i])
+                p.append(wire(self.gates, Xor, self.unique("P"),
+                              self.A[lo + i], self.B[lo + i]))
+            carry.connect(R.Cin)
+            M = Mux(self.unique("M"))
+            self.muxes.append(M)
+            R.Cout.connect(M.A)
+            carry.connect(M.B)
+            wire_tree(self.gates, And, self.unique("K"), p).connect(M.S)
+            carry = M.C
+        carry.connect(self.Cout)
+
+
+# ALU8 opcodes. Subtract and decrement report a borrow on Cout, subtract
+# takes its borrow in on Cin. Opcodes 6 and 7 pass A through.
+ADD, SUB, NEG, INC, DEC, PASS = range(6)
+
+
+class ALU8(LC):         # 8 bit ALU. A, B, Op, Cin in. S, Cout, N, Z, V out
+    inputs = ('A', 'B', 'Op', 'Cin')
+    outputs = ('S', 'Cout', 'N', 'Z', 'V')
+
+    # Every operation is one addition X + Y + c through the adders:
+    #   ADD  A + B + Cin        SUB  A + ~B + ~Cin      NEG  ~A + 0 + 1
+    #   INC  A + 0 + 1          DEC  A + ~0 + 0         PASS A + 0 + 0
+    # so the opcode only decides whether to invert A, gate and invert B
+    # and what goes into the first carry.
+    def __init__(self, name):
+        LC.__init__(self, name)
+        self.A = bus(self, 'A', 8, 1)
+        self.B = bus(self, 'B', 8, 1)
+        self.Op = bus(self, 'Op', 3, 1)
+        self.Cin = Connector(self, 'Cin', 1)
+        self.S = bus(self, 'S', 8)
+        self.Cout = Connector(self, 'Cout')
+        self.N = Connector(self, 'N')       # Negative, sign bit of S
+        self.Z = Connector(self, 'Z')       # Zero, S is all zeros
+        self.V = Connector(self, 'V')       # Signed overflow
+        self.gates = []
+        g = self.gates
+        o0, o1, o2 = self.Op
+        n0 = wire(g, Not, "N0", o0)
+        n1 = wire(g, Not, "N1", o1)
+        n2 = wire(g, Not, "N2", o2)
+        useB = wire(g, And, "UB", n2, n1)                       # ADD, SUB
+        sub = wire(g, And, "SB", useB, o0)                      # SUB
+        neg = wire(g, And, "NG", wire(g, And, "NG1", n2, o1), n0)   # NEG
+        dec = wire(g, And, "DC", wire(g, And, "DC1", o2, n1), n0)   # DEC
+        invY = wire(g, Or, "IY", sub, dec)
+        one = wire(g, And, "C1", n2, o1)                        # NEG, INC
+        cin = wire(g, And, "C2", useB, wire(g, Xor, "C3", self.Cin, sub))
+        carry = wire(g, Or, "C0", cin, one)
+
+        self.adder = RippleCarryAdder("R", 8)
+        R = self.adder
+        carry.connect(R.Cin)
+        for i in range(8):
+            x = wire(g, Xor, "X" + str(i), self.A[i], neg)
+            y = wire(g, Xor, "Y" + str(i),
+                     wire(g, And, "B" + str(i), self.B[i], useB), invY)
+            x.connect(R.A[i])
+            y.connect(R.B[i])
+            R.S[i].connect(self.S[i])
+        wire(g, Xor, "CO", R.Cout, invY).connect(self.Cout)
+        wire(g, Xor, "OV", R.adders[6].Cout, R.Cout).connect(self.V)
+        self.S[7].connect(self.N)
+        nonzero = self.S[0]
+        for i in range(1, 8):
+            nonzero = wire(g, Or, "Z" + str(i), nonzero, self.S[i])
+        wire(g, Not, "NZ", nonzero).connect(self.Z)
+
+    def run(self, op, a, b=0, cin=0):
+        # Settle one operation and return (S, Cout, N, Z, V) as ints. The
+        # same instance serves any number of operations.
+        values = bus_inputs(self.A, a)
+        values.update(bus_inputs(self.B, b))
+        values.update(bus_inputs(self.Op, op))
+        values[self.Cin] = bool(cin)
+        apply_inputs(values)
+        return (bus_value(self.S), int(bool(self.Cout.value)),
+                int(bool(self.N.value)), int(bool(self.Z.value)),
+                int(bool(self.V.value)))
+
+
+class DFF(LC):         # Edge triggered D flip-flop. Input D. Output Q
+    # D does not activate anything; a Clock samples D of every flip-flop
+    # on its edge and only then drives the new values onto Q.
+    __slots__ = ('D', 'Q', 'next')
+    inputs = ('D',)
+    outputs = ('Q',)
+
+    def __init__(self, name, init=0):
+        LC.__init__(self, name)
+        self.D = Connector(self, 'D')
+        self.Q = Connector(self, 'Q')
+        self.next = init
+        self.Q.set(init)
+
+    def sample(self):
+        self.next = self.D.value
+
+    def commit(self):
+        self.Q.set(self.next)
+
+
+class Register(LC):         # n DFFs side by side. D bus in, Q bus out
+    inputs = ('D',)
+    outputs = ('Q',)
+
+    def __init__(self, name, n, init=0):
+        LC.__init__(self, name)
+        self.D = bus(self, 'D', n)
+        self.Q = bus(self, 'Q', n)
+        self.flops = [DFF("R" + str(i), bool(init >> i & 1))
+                      for i in range(n)]
+        for i, F in enumerate(self.flops):
+            self.D[i].connect(F.D)
+            F.Q.connect(self.Q[i])
+
+    def value(self):
+        return bus_value(self.Q)
+
+
+class Clock:
+    # Clock driver for the flip-flops inside the given circuits. A tick is
+    # two phases: every DFF samples its D from the settled logic, then all
+    # new Q values are driven at once and the logic settles again. Only
+    # flip-flops whose output really changes kick the scheduler, so a
+    # cycle costs work in proportion to the logic that changed.
+    def __init__(self, *circuits):
+        self.flops = [lc for circuit in circuits
+                      for path, lc in circuit.walk() if isinstance(lc, DFF)]
+        self.cycle = 0
+
+    def tick(self):
+        for flop in self.flops:
+            flop.sample()
+        with batch():
+            for flop in self.flops:
+                flop.commit()
+        self.cycle += 1
+
+    def run(self, cycles):
+        for _ in range(cycles):
+            self.tick()
+
+
 def bit(x, bit):
     return x[bit] == '1'
 
 
+_adder4 = None      # 4 bit adder shared by every test4Bit call
+
+
 def test4Bit(a, b):    # a, b four char strings like '0110'
-    F0 = FullAdder("F0")
-    F1 = FullAdder("F1")
-    F0.Cout.connect(F1.Cin)
-    F2 = FullAdder("F2")
-    F1.Cout.connect(F2.Cin)
-    F3 = FullAdder("F3")
-    F2.Cout.connect(F3.Cin)
-
-    F0.Cin.set(0)
-    F0.A.set(bit(a, 3))
-    F0.B.set(bit(b, 3))  # bits in lists are reversed from natural order
-    F1.A.set(bit(a, 2))
-    F1.B.set(bit(b, 2))
-    F2.A.set(bit(a, 1))
-    F2.B.set(bit(b, 1))
-    F3.A.set(bit(a, 0))
-    F3.B.set(bit(b, 0))
-
-    print("{0}{1}{2}{3}{4}".format(F3.Cout.value, F3.S.value,
-                                   F2.S.value, F1.S.value, F0.S.value))
+    global _adder4
+    if _adder4 is None:
+        _adder4 = RippleCarryAdder("R", 4)
+    R = _adder4
+
+    # bits in lists are reversed from natural order
+    apply_inputs({R.Cin: 0,
+                  R.A[0]: bit(a, 3),
+                  R.B[0]: bit(b, 3),
+                  R.A[1]: bit(a, 2),
+                  R.B[1]: bit(b, 2),
+                  R.A[2]: bit(a, 1),
+                  R.B[2]: bit(b, 1),
+                  R.A[3]: bit(a, 0),
+                  R.B[3]: bit(b, 0)})
+
+    print("{0}{1}{2}{3}{4}".format(R.Cout.value, R.S[3].value,
+                                   R.S[2].value, R.S[1].value, R.S[0].value))
 
 
 def testFull(a, b, c):
     F1 = FullAdder("F1")
-    F1.Cin.set(c)
-    F1.A.set(a)
-    F1.B.set(b)
+    apply_inputs({F1.Cin: c, F1.A: a, F1.B: b})
 
     print("Cin={0}  A={1}  B={2}".format(c, a, b))
     print("Sum={0}  Cout={1}".format(F1.S.value, F1.Cout.value))
+
+
+def testALU(op, a, b=0, cin=0):     # a, b ints, op one of ADD ... PASS
+    alu = ALU8("ALU")
+    s, cout, n, z, v = alu.run(op, a, b, cin)
+
+    print("Op={0}  A={1:08b}  B={2:08b}  Cin={3}".format(op, a, b, cin))
+    print("S={0:08b}  Cout={1}  N={2}  Z={3}  V={4}".format(s, cout, n, z, v))
@@ -0,0 +1,146 @@
+from netlist import AND, NOT, OR, XOR
+
+
+class LutNetwork:
+    # A compiled circuit mapped onto k input lookup tables. LUT i reads
+    # the nets in leaves[i] and drives net outs[i] with bit
+    # (tables[i] >> index) where index packs the leaf values, first leaf in
+    # bit 0. LUTs are in topological order, nets keep their Netlist numbers.
+    def __init__(self, net, k):
+        self.net = net
+        self.k = k
+        self.leaves = []
+        self.tables = []
+        self.outs = []
+        self.levels = []
+        self.run = None         # generated evaluation function
+
+    def __len__(self):
+        return len(self.outs)
+
+    def depth(self):
+        return max(self.levels, default=0)
+
+    def evaluate(self, inputs):
+        # {input port name: value} -> {output port name: value}
+        net = self.net
+        if self.run is None:
+            self.run = self.generate()
+        values = [1 if value else 0 for value in net.blank()]
+        for name, value in inputs.items():
+            values[net.inputs[name]] = 1 if value else 0
+        self.run(values, self.tables)
+        return {name: bool(values[n]) for name, n in net.outputs.items()}
+
+    def generate(self):
+        # Straight line Python for the whole network, one statement per
+        # LUT: values[out] = table >> (packed leaf bits) & 1
+        lines = ["def run(v, T):"]
+        for i, (leaves, out) in enumerate(zip(self.leaves, self.outs)):
+            index = ' | '.join('v[{0}] << {1}'.format(leaf, j) if j else
+                               'v[{0}]'.format(leaf)
+                               for j, leaf in enumerate(leaves))
+            lines.append("    v[{0}] = T[{1}] >> ({2}) & 1".format(
+                out, i, index))
+        lines.append("    return v")
+        scope = {}
+        exec('\n'.join(lines), scope)
+        return scope['run']
+
+    def report(self):
+        sizes = {}
+        for leaves in self.leaves:
+            sizes[len(leaves)] = sizes.get(len(leaves), 0) + 1
+        lines = ["{0}: {1} gates, depth {2} -> {3} LUT{4}s, depth {5}".format(
+            self.net.name, len(self.net), self.net.depth(), len(self),
+            self.k, self.depth())]
+        for size in sorted(sizes):
+            lines.append("  {0} input LUTs: {1}".format(size, sizes[size]))
+        return '\n'.join(lines)
+
+
+def map_luts(net, k=4, keep=8):
+    # Depth oriented technology mapping of a Netlist onto k input LUTs.
+    # Every gate output gets up to keep k-feasible cuts (sets of at most k
+    # nets that separate it from the circuit inputs), ranked by the LUT
+    # depth they give and then by size. The outputs are then covered from
+    # the back with each needed net's best cut, and every chosen cut's
+    # logic cone is collapsed into a truth table.
+    driver = {}
+    for g, out in enumerate(net.outs):
+        driver[out] = g
+    depth = {}                  # net -> LUT depth of its best cut
+    best = {}                   # gate output net -> best cut
+    cuts = {}                   # net -> cuts, each a sorted tuple of nets
+
+    def leaf_cuts(n):
+        if n not in cuts:       # circuit input, constant or undriven net
+            cuts[n] = [(n,)]
+            depth[n] = 0
+        return cuts[n]
+
+    for g in range(len(net)):
+        a, b, out = net.in0[g], net.in1[g], net.outs[g]
+        merged = set()
+        for ca in leaf_cuts(a):
+            for cb in (leaf_cuts(b) if b >= 0 else [()]):
+                cut = tuple(sorted(set(ca) | set(cb)))
+                if len(cut) <= k:
+                    merged.add(cut)
+        ranked = sorted(merged, key=lambda cut: (
+            1 + max(depth[leaf] for leaf in cut), len(cut), cut))[:keep]
+        best[out] = ranked[0]
+        depth[out] = 1 + max(depth[leaf] for leaf in ranked[0])
+        cuts[out] = [(out,)] + ranked
+
+    mapped = LutNetwork(net, k)
+    needed = [n for n in net.outputs.values() if n in driver]
+    chosen = set(needed)
+    order = []
+    while needed:
+        n = needed.pop()
+        order.append(n)
+        for leaf in best[n]:
+            if leaf in driver and leaf not in chosen:
+                chosen.add(leaf)
+                needed.append(leaf)
+    order.sort(key=lambda n: (depth[n], driver[n]))
+    for n in order:
+        mapped.leaves.append(best[n])
+        mapped.tables.append(cone_table(net, driver, n, best[n]))
+        mapped.outs.append(n)
+        mapped.levels.append(depth[n])
+    return mapped
+
+
+def cone_table(net, driver, out, leaves):
+    # Truth table of net out as a function of the cut leaves, worked out
+    # bit-parallel: leaf j carries the pattern of bit j over every index
+    width = 1 << len(leaves)
+    mask = (1 << width) - 1
+    values = {}
+    for j, leaf in enumerate(leaves):
+        values[leaf] = sum(1 << i for i in range(width) if i >> j & 1)
+    stack = [out]
+    while stack:
+        n = stack[-1]
+        if n in values:
+            stack.pop()
+            continue
+        g = driver[n]
+        a, b = net.in0[g], net.in1[g]
+        missing = [i for i in (a, b) if i >= 0 and i not in values]
+        if missing:
+            stack.extend(missing)
+            continue
+        stack.pop()
+        op = net.ops[g]
+        if op == AND:
+            values[n] = values[a] & values[b]
+        elif op == OR:
+            values[n] = values[a] | values[b]
+        elif op == XOR:
+            values[n] = values[a] ^ values[b]
+        elif op == NOT:
+            values[n] = values[a] ^ mask
+    return values[out]
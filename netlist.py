@@ -0,0 +1,447 @@
+from collections import OrderedDict
+
+from logic import (And, CircuitLoopError, Const, Not, Or, Xor, XorGate,
+                   check_loops)
+
+
+# Gate types of a compiled netlist
+NOT, AND, OR, XOR = range(4)
+OP_NAMES = ('NOT', 'AND', 'OR', 'XOR')
+OPS = {Not: NOT, And: AND, Or: OR, XorGate: XOR}   # primitive class -> type
+LEAF_OPS = {Xor: XOR}   # composites that may be kept whole, see leaves
+OP_CLASSES = (Not, And, Or, Xor)        # gate type -> class
+
+
+class Netlist:
+    # Flat, levelized form of an LC hierarchy. Every wire is a net number
+    # and gate i computes ops[i] of nets in0[i] and in1[i] (-1 when unused)
+    # into net outs[i]. Gates are sorted by level so one pass in list order
+    # settles the whole circuit, no matter how deep the hierarchy was.
+    def __init__(self, name):
+        self.name = name
+        self.names = []         # hierarchical connector name of each net
+        self.aliases = {}       # every connector name -> its net
+        self.inputs = {}        # input port name -> net
+        self.outputs = {}       # output port name -> net
+        self.constants = {}     # tied off net -> value
+        self.ops = []
+        self.in0 = []
+        self.in1 = []
+        self.outs = []
+        self.levels = []        # level of each gate, circuit inputs are 0
+        self.gates = []         # hierarchical name of each gate
+
+    def __len__(self):
+        return len(self.ops)
+
+    def depth(self):
+        return max(self.levels, default=0)
+
+    def evaluate(self, inputs):
+        # {input port name: value} -> {output port name: value}
+        values = self.blank()
+        for name, value in inputs.items():
+            values[self.inputs[name]] = value
+        self.settle(values)
+        return {name: values[net] for name, net in self.outputs.items()}
+
+    def blank(self):
+        # Fresh net values, all False but for the constants
+        values = [False] * len(self.names)
+        for net, value in self.constants.items():
+            values[net] = value
+        return values
+
+    def settle(self, values):
+        # One pass over the gates, updating the net values list in place
+        for op, a, b, out in zip(self.ops, self.in0, self.in1, self.outs):
+            if op == AND:
+                values[out] = values[a] and values[b]
+            elif op == OR:
+                values[out] = values[a] or values[b]
+            elif op == XOR:
+                values[out] = ((values[a] and not values[b]) or
+                               (values[b] and not values[a]))
+            else:
+                values[out] = not values[a]
+
+    def evaluate_words(self, inputs, width=64):
+        # Bit-parallel evaluation. Each input is a width bit int whose bit k
+        # belongs to test vector k, so one pass settles width vectors. Any
+        # width works, Python ints are unbounded.
+        mask = (1 << width) - 1
+        values = [0] * len(self.names)
+        for net, value in self.constants.items():
+            values[net] = mask if value else 0
+        for name, word in inputs.items():
+            values[self.inputs[name]] = word & mask
+        for op, a, b, out in zip(self.ops, self.in0, self.in1, self.outs):
+            if op == AND:
+                values[out] = values[a] & values[b]
+            elif op == OR:
+                values[out] = values[a] | values[b]
+            elif op == XOR:
+                values[out] = values[a] ^ values[b]
+            else:
+                values[out] = values[a] ^ mask
+        return {name: values[net] for name, net in self.outputs.items()}
+
+    def evaluate_arrays(self, inputs):
+        # Vectorized evaluation over NumPy arrays, one element per test
+        # vector. Bool arrays hold one vector per element, unsigned int
+        # arrays (uint8 ... uint64) pack one vector per bit; either way the
+        # gates are single whole-array ops. Needs numpy.
+        np = _numpy()
+        inputs = {name: np.asarray(value) for name, value in inputs.items()}
+        zero = np.zeros_like(next(iter(inputs.values())))
+        values = [zero] * len(self.names)
+        for net, value in self.constants.items():
+            values[net] = ~zero if value else zero
+        for name, array in inputs.items():
+            values[self.inputs[name]] = array
+        for op, a, b, out in zip(self.ops, self.in0, self.in1, self.outs):
+            if op == AND:
+                values[out] = values[a] & values[b]
+            elif op == OR:
+                values[out] = values[a] | values[b]
+            elif op == XOR:
+                values[out] = values[a] ^ values[b]
+            else:
+                values[out] = ~values[a]
+        return {name: values[net] for name, net in self.outputs.items()}
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("array evaluation needs numpy, pip install numpy")
+    return numpy
+
+
+def split_bus(name, values, width):
+    # Integer array -> {name0: bits, name1: bits, ...} bool arrays for the
+    # connectors of a width bit bus port, least significant bit first
+    np = _numpy()
+    values = np.asarray(values)
+    return {name + str(i): (values >> i & 1).astype(bool)
+            for i in range(width)}
+
+
+def join_bus(outputs, name, width):
+    # Inverse of split_bus: bit arrays of a bus output -> integer array
+    np = _numpy()
+    total = np.zeros(len(outputs[name + '0']), dtype=np.uint64)
+    for i in range(width):
+        total |= outputs[name + str(i)].astype(np.uint64) << np.uint64(i)
+    return total
+
+
+def pack_vectors(vectors):
+    # [{port: bit}, ...] -> {port: word} with vector k in bit k
+    words = {}
+    for k, vector in enumerate(vectors):
+        for name, value in vector.items():
+            words[name] = words.get(name, 0) | (bool(value) << k)
+    return words
+
+
+def unpack_words(words, count):
+    # {port: word} -> [{port: bool}, ...], the inverse of pack_vectors
+    return [{name: bool(word >> k & 1) for name, word in words.items()}
+            for k in range(count)]
+
+
+def gate_type(lc, leaves=()):
+    # Netlist gate type of a primitive gate or of a composite kept whole,
+    # None for composites to flatten
+    for cls in type(lc).__mro__:
+        if cls in OPS:
+            return OPS[cls]
+        if cls in leaves:
+            return LEAF_OPS[cls]
+    return None
+
+
+def compile_circuit(root, leaves=()):
+    # Flatten the LC hierarchy under root into a levelized Netlist.
+    # Connectors wired together share a net; composites disappear and only
+    # their primitive gates are kept. Composite classes listed in leaves
+    # (those in LEAF_OPS, i.e. Xor) are kept as single gates instead. A
+    # memoized composite is cut off from its parts, so the gates of its
+    # Memo's netlist stand in for them.
+    for cls in leaves:
+        if cls not in LEAF_OPS:
+            raise ValueError("{0} cannot be kept as a single gate".format(
+                cls.__name__))
+    connectors = []     # every connector in the hierarchy
+    names = []          # and its hierarchical name
+    prims = []          # (primitive gate, hierarchical name)
+    memos = []          # (memoized composite, hierarchical name)
+    stack = [(root, root.name)]
+    while stack:
+        lc, path = stack.pop()
+        for con in lc.ports():
+            connectors.append(con)
+            names.append(path + '.' + con.name)
+        if gate_type(lc, leaves) is not None or isinstance(lc, Const):
+            prims.append((lc, path))
+            continue
+        if isinstance(getattr(lc, '__dict__', {}).get('memo'), Memo):
+            memos.append((lc, path))
+            continue
+        parts = list(lc.parts())
+        if not parts:
+            raise TypeError("{0}: {1} is neither a primitive gate nor built "
+                            "from parts".format(path, type(lc).__name__))
+        for part in reversed(parts):
+            stack.append((part, path + '.' + part.name))
+
+    # Connectors joined by wires collapse into one net
+    index = {id(con): i for i, con in enumerate(connectors)}
+    parent = list(range(len(connectors)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, con in enumerate(connectors):
+        for other in con.connects:
+            j = index.get(id(other))
+            if j is not None:       # wires leaving the hierarchy are ignored
+                parent[find(j)] = find(i)
+
+    net = Netlist(root.name)
+    nets = {}
+    for i in range(len(connectors)):
+        r = find(i)
+        if r not in nets:
+            nets[r] = len(net.names)
+            net.names.append(names[i])
+    netof = [nets[find(i)] for i in range(len(connectors))]
+    net.aliases = dict(zip(names, netof))
+
+    def net_of(con):
+        return netof[index[id(con)]]
+
+    for con in root.ports(root.inputs):
+        net.inputs[con.name] = net_of(con)
+    for con in root.ports(root.outputs):
+        net.outputs[con.name] = net_of(con)
+
+    # One gate per primitive, then order them by level
+    found = []          # (gate type, input nets, output net, name)
+    for lc, path in prims:
+        if isinstance(lc, Const):
+            net.constants[net_of(lc.C)] = lc.value
+            continue
+        found.append((gate_type(lc, leaves),
+                      [net_of(con) for con in lc.ports(lc.inputs)],
+                      net_of(next(lc.ports(lc.outputs))), path))
+    for lc, path in memos:
+        found.extend(inline_memo(net, lc, path, net_of))
+    gates = []
+    driver = [None] * len(net.names)
+    for op, ins, out, path in found:
+        if driver[out] is not None:
+            raise ValueError("net {0} has more than one driver".format(
+                net.names[out]))
+        driver[out] = len(gates)
+        gates.append((op, ins, out, path))
+
+    users = [[] for _ in net.names]
+    waiting = []
+    for g, (op, ins, out, path) in enumerate(gates):
+        count = 0
+        for n in ins:
+            if driver[n] is not None:
+                users[n].append(g)
+                count += 1
+        waiting.append(count)
+    ready = [g for g, count in enumerate(waiting) if count == 0]
+    netlevel = [0] * len(net.names)
+    levels = [0] * len(gates)
+    for g in ready:             # ready grows while it is walked
+        op, ins, out, path = gates[g]
+        levels[g] = 1 + max(netlevel[n] for n in ins)
+        netlevel[out] = levels[g]
+        for user in users[out]:
+            waiting[user] -= 1
+            if waiting[user] == 0:
+                ready.append(user)
+    if len(ready) < len(gates):
+        check_loops(root)
+        stuck = [gates[g][3] for g, count in enumerate(waiting) if count]
+        raise CircuitLoopError("combinational loop through {0}".format(
+            ', '.join(stuck)))
+
+    for g in sorted(range(len(gates)), key=lambda g: (levels[g], g)):
+        op, ins, out, path = gates[g]
+        net.ops.append(op)
+        net.in0.append(ins[0])
+        net.in1.append(ins[1] if len(ins) > 1 else -1)
+        net.outs.append(out)
+        net.levels.append(levels[g])
+        net.gates.append(path)
+    return net
+
+
+def inline_memo(net, lc, path, net_of):
+    # Gates of the memoized composite lc at path, copied from its Memo's
+    # netlist into net: its ports map to the nets of lc's ports and its
+    # inner nets become new nets named under path
+    sub = lc.memo.net
+    local = {}          # net of sub -> net of net
+    for con in lc.ports(lc.inputs):
+        local[sub.inputs[con.name]] = net_of(con)
+    for con in lc.ports(lc.outputs):
+        n = sub.outputs[con.name]
+        if local.setdefault(n, net_of(con)) != net_of(con):
+            raise ValueError("{0}: output {1} of a memoized {2} is wired "
+                             "straight to another port".format(
+                                 path, con.name, type(lc).__name__))
+    for n, name in enumerate(sub.names):
+        if n not in local:
+            local[n] = len(net.names)
+            net.names.append(path + name[len(sub.name):])
+    for name, n in sub.aliases.items():
+        net.aliases.setdefault(path + name[len(sub.name):], local[n])
+    for n, value in sub.constants.items():
+        net.constants[local[n]] = value
+    for op, a, b, out, name in zip(sub.ops, sub.in0, sub.in1, sub.outs,
+                                   sub.gates):
+        ins = [local[a]] if b < 0 else [local[a], local[b]]
+        yield op, ins, local[out], path + name[len(sub.name):]
+
+
+class Instance:
+    # A circuit stamped out of a shared template. The structure lives once
+    # in the template's Netlist; an instance only holds its net values, so
+    # creating one costs a single list no matter how big the circuit is.
+    __slots__ = ('net', 'values')
+
+    def __init__(self, net):
+        self.net = net
+        self.values = net.blank()
+
+    def set(self, name, value):
+        self.values[self.net.inputs[name]] = value
+
+    def get(self, name):
+        return self.values[self.net.outputs[name]]
+
+    def evaluate(self):
+        self.net.settle(self.values)
+
+    def apply(self, inputs):
+        # Set {input port name: value}, settle, return the outputs
+        values = self.values
+        for name, value in inputs.items():
+            values[self.net.inputs[name]] = value
+        self.net.settle(values)
+        return {name: values[net] for name, net in self.net.outputs.items()}
+
+
+_templates = {}     # (class, args) -> compiled Netlist
+
+
+def template(cls, *args):
+    # Netlist of cls(name, *args), built and compiled once per class and
+    # arguments and shared by every instance
+    key = (cls,) + args
+    net = _templates.get(key)
+    if net is None:
+        net = _templates[key] = compile_circuit(cls(cls.__name__, *args))
+    return net
+
+
+def instance(cls, *args):
+    # New Instance of the cls(name, *args) template
+    return Instance(template(cls, *args))
+
+
+class Memo:
+    # Input -> output mapping of a pure combinational circuit. Up to limit
+    # inputs the whole truth table is computed up front in one
+    # bit-parallel pass; wider circuits fill a least recently used cache
+    # of at most size rows, one compiled evaluation per miss. Rows are
+    # indexed by the input bits, first input port in bit 0.
+    def __init__(self, net, limit=8, size=4096):
+        self.net = net
+        self.names = list(net.inputs)
+        self.table = None
+        self.cache = OrderedDict()
+        self.size = size
+        count = 1 << len(self.names)
+        if len(self.names) <= limit:
+            words = {name: sum(1 << k for k in range(count) if k >> j & 1)
+                     for j, name in enumerate(self.names)}
+            out = net.evaluate_words(words, count)
+            self.table = [tuple(bool(word >> k & 1) for word in out.values())
+                          for k in range(count)]
+
+    def lookup(self, index):
+        if self.table is not None:
+            return self.table[index]
+        row = self.cache.get(index)
+        if row is not None:
+            self.cache.move_to_end(index)
+            return row
+        out = self.net.evaluate({name: bool(index >> j & 1)
+                                 for j, name in enumerate(self.names)})
+        row = self.cache[index] = tuple(bool(v) for v in out.values())
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+        return row
+
+
+def memoize(lc, memo=None):
+    # Opt in a composite LC to table lookup. Its input ports are cut off
+    # from its parts and instead activate a lookup that drives the output
+    # ports, so the parts are never evaluated again. Unset (None) inputs
+    # read as False. Pass a Memo to share one table between instances;
+    # it is kept as lc.memo, which compile_circuit compiles in place of
+    # the parts.
+    if memo is None:
+        memo = Memo(compile_circuit(lc))
+    ins = list(lc.ports(lc.inputs))
+    outs = list(lc.ports(lc.outputs))
+    for con in ins:
+        con.connects = ()
+        con.activates = 1
+
+    def evaluate():
+        index = 0
+        for j, con in enumerate(ins):
+            if con.value:
+                index |= 1 << j
+        for con, value in zip(outs, memo.lookup(index)):
+            con.set(value)
+
+    lc.memo = memo
+    lc.evaluate = evaluate
+    evaluate()
+    return lc
+
+
+def memoize_all(root, classes, limit=8, size=4096):
+    # Memoize every instance of the given classes under root (root too),
+    # one shared Memo per class and port layout. Parts of a memoized
+    # circuit are left alone. Returns how many circuits were memoized.
+    classes = tuple(classes)
+    memos = {}
+    count = 0
+    stack = [root]
+    while stack:
+        lc = stack.pop()
+        if not isinstance(lc, classes):
+            stack.extend(lc.parts())
+            continue
+        key = (type(lc),) + tuple(con.name for con in lc.ports())
+        if key not in memos:
+            memos[key] = Memo(compile_circuit(lc), limit, size)
+        memoize(lc, memos[key])
+        count += 1
+    return count
@@ -0,0 +1,199 @@
+from netlist import AND, NOT, OR, XOR, Netlist
+
+
+# Optimization passes over compiled netlists. Each pass returns a new
+# Netlist and leaves its argument alone; nets keep their numbers and
+# names, so results can be compared and passes chained.
+
+
+def rebuild(net, gates, inputs=None, outputs=None, constants=None,
+            aliases=None):
+    # New Netlist over the nets of net with gates, a topologically ordered
+    # list of (op, in0, in1, out, gate name); levels are recomputed
+    new = Netlist(net.name)
+    new.names = list(net.names)
+    new.aliases = dict(net.aliases if aliases is None else aliases)
+    new.inputs = dict(net.inputs if inputs is None else inputs)
+    new.outputs = dict(net.outputs if outputs is None else outputs)
+    new.constants = dict(net.constants if constants is None else constants)
+    level = {}
+    for op, a, b, out, name in gates:
+        new.ops.append(op)
+        new.in0.append(a)
+        new.in1.append(b)
+        new.outs.append(out)
+        new.gates.append(name)
+        level[out] = 1 + max(level.get(a, 0), level.get(b, 0))
+        new.levels.append(level[out])
+    return new
+
+
+def gates_of(net):
+    # The gates of net as (op, in0, in1, out, gate name) tuples
+    return list(zip(net.ops, net.in0, net.in1, net.outs, net.gates))
+
+
+def propagate_constants(net, tied=None):
+    # Fold constants through the netlist. tied maps input port names to
+    # fixed values (e.g. {'Cin': 0}); those inputs become constants along
+    # with the netlist's own. A gate with a constant result is removed, as
+    # is one that just passes an input through (And with 1, Or with 0, Xor
+    # with 0, both inputs the same net); Xor with 1 becomes a Not. Returns
+    # (new netlist, number of gates eliminated).
+    const = dict(net.constants)
+    inputs = dict(net.inputs)
+    for name, value in (tied or {}).items():
+        const[inputs.pop(name)] = bool(value)
+    alias = {}
+
+    def resolve(n):
+        while n in alias:
+            n = alias[n]
+        return n
+
+    gates = []
+    for op, a, b, out, name in gates_of(net):
+        a = resolve(a)
+        b = resolve(b) if b >= 0 else b
+        ca, cb = const.get(a), const.get(b)
+        if op == NOT:
+            if ca is not None:
+                const[out] = not ca
+                continue
+        elif ca is not None and cb is not None:
+            if op == AND:
+                const[out] = ca and cb
+            elif op == OR:
+                const[out] = ca or cb
+            else:
+                const[out] = ca != cb
+            continue
+        elif a == b:
+            if op == XOR:
+                const[out] = False
+            else:
+                alias[out] = a
+            continue
+        elif ca is not None or cb is not None:
+            value, other = (ca, b) if ca is not None else (cb, a)
+            if op == AND and not value or op == OR and value:
+                const[out] = value
+            elif op == XOR and value:
+                gates.append((NOT, other, -1, out, name))
+            else:
+                alias[out] = other
+            continue
+        gates.append((op, a, b, out, name))
+
+    outputs = {}
+    constants = dict(net.constants)
+    for port, n in net.outputs.items():
+        n = resolve(n)
+        outputs[port] = n
+        if n in const:
+            constants[n] = const[n]
+    for op, a, b, out, name in gates:     # constants still read by gates
+        for n in (a, b):
+            if n in const:
+                constants[n] = const[n]
+    aliases = {}        # names follow their nets to what replaced them
+    for name, n in net.aliases.items():
+        n = aliases[name] = resolve(n)
+        if n in const:
+            constants[n] = const[n]
+    new = rebuild(net, gates, inputs, outputs, constants, aliases)
+    return new, len(net) - len(new)
+
+
+def eliminate_dead(net, observed=None):
+    # Keep only the logic that reaches the observed outputs. observed lists
+    # output port names or the hierarchical name of any connector on a net
+    # (the net becomes an output under that name), all outputs by default.
+    # Inputs are kept so input vectors stay valid. A net an earlier pass
+    # removed (no driver, not an input or constant) raises KeyError like an
+    # unknown name. Returns (new netlist, gates removed).
+    if observed is None:
+        observed = list(net.outputs)
+    known = set(net.outs) | set(net.inputs.values()) | set(net.constants)
+    outputs = {}
+    for name in observed:
+        if name in net.outputs:
+            outputs[name] = net.outputs[name]
+        elif net.aliases.get(name) in known:
+            outputs[name] = net.aliases[name]
+        elif name in net.aliases:
+            raise KeyError("net {0!r} has no driver".format(name))
+        else:
+            raise KeyError("no output or net named {0!r}".format(name))
+    live = set(outputs.values())
+    gates = []
+    for gate in reversed(gates_of(net)):
+        op, a, b, out, name = gate
+        if out in live:
+            gates.append(gate)
+            live.add(a)
+            if b >= 0:
+                live.add(b)
+    gates.reverse()
+    constants = {n: v for n, v in net.constants.items() if n in live}
+    new = rebuild(net, gates, outputs=outputs, constants=constants)
+    return new, len(net) - len(new)
+
+
+def recognize_xor(net):
+    # Find the five gate Xor pattern
+    #     Or(And(a, Not(b)), And(b, Not(a)))
+    # with operands in any order, and replace it by one XOR gate. The Ands
+    # must feed only that Or; the Nots are dropped too unless something
+    # else still reads them. Returns (new netlist, patterns replaced).
+    gates = gates_of(net)
+    driver = {}
+    fanout = {}
+    for g, (op, a, b, out, name) in enumerate(gates):
+        driver[out] = g
+        for n in (a, b):
+            if n >= 0:
+                fanout[n] = fanout.get(n, 0) + 1
+    for n in net.outputs.values():
+        fanout[n] = fanout.get(n, 0) + 1
+
+    def op_of(n):
+        g = driver.get(n)
+        return None if g is None else gates[g][0]
+
+    def and_not(n):
+        # (x, y, not gate output) when n = And(x, Not(y)), else None
+        if op_of(n) != AND or fanout[n] != 1:
+            return None
+        op, a, b, out, name = gates[driver[n]]
+        for x, inv in ((a, b), (b, a)):
+            if op_of(inv) == NOT:
+                return x, gates[driver[inv]][1], inv
+        return None
+
+    replace = {}        # Or gate -> (a, b)
+    dropped = set()     # gates to remove
+    for g, (op, a, b, out, name) in enumerate(gates):
+        if op != OR:
+            continue
+        left, right = and_not(a), and_not(b)
+        if not left or not right:
+            continue
+        if (left[0], left[1]) != (right[1], right[0]) or left[0] == left[1]:
+            continue
+        replace[g] = (left[0], left[1])
+        dropped.update((driver[a], driver[b]))
+        for inv in (left[2], right[2]):
+            fanout[inv] -= 1
+    for g in list(dropped):
+        for n in (gates[g][1], gates[g][2]):
+            if op_of(n) == NOT and fanout[n] == 0:
+                dropped.add(driver[n])
+
+    kept = []
+    for g, (op, a, b, out, name) in enumerate(gates):
+        if g in replace:
+            kept.append((XOR, replace[g][0], replace[g][1], out, name))
+        elif g not in dropped:
+            kept.append((op, a, b, out, name))
+    return rebuild(net, kept), len(replace)
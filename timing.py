@@ -0,0 +1,63 @@
+from logic import And, Not, Or
+from netlist import OP_CLASSES, OP_NAMES, compile_circuit
+
+
+# Default gate delays. Add a composite class (only Xor is supported) to
+# time it as one gate instead of through its parts.
+DELAYS = {Not: 1, And: 1, Or: 1}
+
+
+class Timing:
+    # Static timing of a compiled circuit: arrival time of every net with
+    # all inputs arriving at 0, and the critical path into the slowest
+    # output as a list of (net name, arrival, gate name or None).
+    def __init__(self, net, arrival, path):
+        self.net = net
+        self.arrival = arrival
+        self.path = path
+        self.delay = path[-1][1] if path else 0
+
+    def outputs(self):
+        # {output port name: arrival time}
+        return {name: self.arrival[n] for name, n in self.net.outputs.items()}
+
+    def __str__(self):
+        lines = ["critical path of {0}: {1}".format(self.net.name,
+                                                    self.delay)]
+        ops = dict(zip(self.net.gates, self.net.ops))
+        for name, arrival, gate in self.path:
+            kind = '' if gate is None else OP_NAMES[ops[gate]]
+            lines.append("{0:>6}  {1:<40} {2:<4} {3}".format(
+                arrival, name, kind, gate or '').rstrip())
+        return '\n'.join(lines)
+
+
+def timing(root, delays=None):
+    # Levelize the LC hierarchy under root and compute arrival times with
+    # the given {gate class: delay}, DELAYS by default
+    if delays is None:
+        delays = DELAYS
+    leaves = [cls for cls in delays if cls not in (Not, And, Or)]
+    net = compile_circuit(root, leaves)
+    delay = [delays.get(cls, 1) for cls in OP_CLASSES]
+    arrival = [0] * len(net.names)
+    driver = [None] * len(net.names)
+    for g, (op, a, b, out) in enumerate(zip(net.ops, net.in0, net.in1,
+                                            net.outs)):
+        late = arrival[a] if b < 0 else max(arrival[a], arrival[b])
+        arrival[out] = late + delay[op]
+        driver[out] = g
+
+    path = []
+    if net.outputs:
+        n = max(net.outputs.values(), key=lambda n: arrival[n])
+        while n is not None:
+            g = driver[n]
+            path.append((net.names[n], arrival[n],
+                         None if g is None else net.gates[g]))
+            if g is None:
+                break
+            a, b = net.in0[g], net.in1[g]
+            n = a if b < 0 or arrival[a] >= arrival[b] else b
+        path.reverse()
+    return Timing(net, arrival, path)
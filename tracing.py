@@ -0,0 +1,167 @@
+import sys
+from array import array
+
+from logic import scheduler
+
+
+class TraceBuffer:
+    # Fixed size ring buffer of monitored connector changes. Recording
+    # stores three numbers in preallocated arrays (trace time, connector
+    # number, value) and formats nothing; once full the oldest entries are
+    # overwritten. Format the contents on demand with dump().
+    #     trace = TraceBuffer(4096).start()
+    #     ... run ...
+    #     trace.stop().dump()
+    NONE = 2                            # value code of an unset connector
+
+    def __init__(self, size=1 << 16):
+        self.size = size
+        self.times = array('q', bytes(8 * size))
+        self.ids = array('l', bytes(array('l').itemsize * size))
+        self.values = bytearray(size)   # 0, 1 or NONE
+        self.count = 0                  # changes recorded so far
+        self.connectors = []            # connector number -> connector
+        self.numbers = {}               # id(connector) -> connector number
+
+    def start(self):
+        scheduler.monitors.append(self)
+        return self
+
+    def stop(self):
+        scheduler.monitors.remove(self)
+        return self
+
+    def record(self, con, value):
+        number = self.numbers.get(id(con))
+        if number is None:
+            number = self.numbers[id(con)] = len(self.connectors)
+            self.connectors.append(con)
+        i = self.count % self.size
+        self.times[i] = scheduler.now()
+        self.ids[i] = number
+        self.values[i] = self.NONE if value is None else bool(value)
+        self.count += 1
+
+    def entries(self):
+        # (trace time, connector, value) still in the buffer, oldest first
+        first = max(0, self.count - self.size)
+        for k in range(first, self.count):
+            i = k % self.size
+            value = self.values[i]
+            yield (self.times[i], self.connectors[self.ids[i]],
+                   None if value == self.NONE else bool(value))
+
+    def dump(self, file=None, root=None):
+        # Write the buffer as text, one change per line. Connectors under
+        # root get hierarchical names, others owner.connector.
+        if file is None:
+            file = sys.stdout
+        names = {}
+        if root is not None:
+            for path, lc in root.walk():
+                for con in lc.ports():
+                    names[id(con)] = path + '.' + con.name
+        dropped = self.count - self.size
+        if dropped > 0:
+            file.write("... {0} older changes dropped\n".format(dropped))
+        for time, con, value in self.entries():
+            name = names.get(id(con))
+            if name is None:
+                name = con.owner.name + '.' + con.name
+            file.write("{0:>10}  {1:<30} {2}\n".format(time, name, value))
+
+
+def vcd_code(number):
+    # Compact VCD identifier: base 94 over the printable characters
+    code = ''
+    while True:
+        code += chr(33 + number % 94)
+        number //= 94
+        if not number:
+            return code
+
+
+class VCDWriter:
+    # Streams changes of the monitored connectors under root to a VCD
+    # waveform file, timestamped by scheduler trace time (Scheduler.now).
+    # Changes are buffered and written every `buffer` lines, so memory
+    # stays flat no matter how long the run is. Pass everything=True to
+    # record every connector, not just the monitored ones.
+    #     with VCDWriter('adder.vcd', adder):
+    #         adder.add(5, 3)
+    def __init__(self, file, root, everything=False, buffer=4096,
+                 timescale='1ns'):
+        self.own = isinstance(file, str)
+        self.file = open(file, 'w') if self.own else file
+        self.buffer = buffer
+        self.lines = []
+        self.codes = {}         # id(connector) -> identifier code
+        self.file.write("$timescale {0} $end\n".format(timescale))
+        self.file.write('\n'.join(self.scope(root, everything)) + '\n')
+        self.file.write("$enddefinitions $end\n")
+        self.time = scheduler.time
+        self.file.write("#{0}\n$dumpvars\n".format(self.time))
+        for path, lc in root.walk():
+            for con in lc.ports():
+                if id(con) in self.codes:
+                    self.file.write(self.change(con, con.value) + '\n')
+        self.file.write("$end\n")
+
+    def scope(self, lc, everything):
+        # Declarations for lc and below, empty when nothing is recorded
+        lines = []
+        for con in lc.ports():
+            if (everything or con.monitor) and id(con) not in self.codes:
+                code = self.codes[id(con)] = vcd_code(len(self.codes))
+                lines.append("$var wire 1 {0} {1} $end".format(
+                    code, con.name))
+        for part in lc.parts():
+            lines.extend(self.scope(part, everything))
+        if not lines:
+            return lines
+        return (["$scope module {0} $end".format(lc.name)] + lines +
+                ["$upscope $end"])
+
+    def change(self, con, value):
+        code = self.codes[id(con)]
+        if value is None:
+            return 'x' + code
+        return ('1' if value else '0') + code
+
+    def start(self):
+        scheduler.monitors.append(self)
+        return self
+
+    def stop(self):
+        scheduler.monitors.remove(self)
+        return self
+
+    def record(self, con, value):
+        if id(con) not in self.codes:
+            return
+        time = scheduler.now()
+        if time != self.time:
+            self.time = time
+            self.lines.append('#' + str(self.time))
+        self.lines.append(self.change(con, value))
+        if len(self.lines) >= self.buffer:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.file.write('\n'.join(self.lines) + '\n')
+            self.lines = []
+        self.file.flush()
+
+    def close(self):
+        if self in scheduler.monitors:
+            self.stop()
+        self.flush()
+        if self.own:
+            self.file.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()